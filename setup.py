@@ -21,11 +21,15 @@ setup(
     },
     test_suite="tests",
     install_requires=[
+        "orjson",
         "prometheus_client>=0.0.11",
         "pyyaml",
         "requests",
         'Werkzeug',
     ],
+    extras_require={
+        "uvloop": ["uvloop"],
+    },
     classifiers=[
         "Development Status :: 3 - Alpha",
         "Intended Audience :: Information Technology",
@@ -14,40 +14,190 @@ Prometheus collectors for FreeSWITCH.
 
 
 import asyncio
+import concurrent.futures
 import itertools
-import json
 import logging
+import re
 
-from prometheus_client import CollectorRegistry, generate_latest
+import orjson
+from prometheus_client import generate_latest
 from prometheus_client.core import GaugeMetricFamily
 
-from freeswitch_exporter.esl import ESL
+from freeswitch_exporter.esl import ESLPool
 from freeswitch_exporter.sofia_status import SofiaProfile, SofiaProfileStatus
 
 
+def _split(items, count):
+    """
+    Split a list into at most count contiguous batches.
+    """
+
+    step = max(1, -(-len(items) // count))
+    return [items[i:i + step] for i in range(0, len(items), step)]
+
+
+# (channel variable, metric name, help) of the per-channel gauges.
+_CHANNEL_METRIC_DEFS = (
+    ('variable_rtp_audio_in_raw_bytes',
+     'rtp_audio_in_raw_bytes_total',
+     'Total number of bytes received via this channel.'),
+    ('variable_rtp_audio_out_raw_bytes',
+     'rtp_audio_out_raw_bytes_total',
+     'Total number of bytes sent via this channel.'),
+    ('variable_rtp_audio_in_media_bytes',
+     'rtp_audio_in_media_bytes_total',
+     'Total number of media bytes received via this channel.'),
+    ('variable_rtp_audio_out_media_bytes',
+     'rtp_audio_out_media_bytes_total',
+     'Total number of media bytes sent via this channel.'),
+    ('variable_rtp_audio_in_packet_count',
+     'rtp_audio_in_packets_total',
+     'Total number of packets received via this channel.'),
+    ('variable_rtp_audio_out_packet_count',
+     'rtp_audio_out_packets_total',
+     'Total number of packets sent via this channel.'),
+    ('variable_rtp_audio_in_media_packet_count',
+     'rtp_audio_in_media_packets_total',
+     'Total number of media packets received via this channel.'),
+    ('variable_rtp_audio_out_media_packet_count',
+     'rtp_audio_out_media_packets_total',
+     'Total number of media packets sent via this channel.'),
+    ('variable_rtp_audio_in_skip_packet_count',
+     'rtp_audio_in_skip_packets_total',
+     'Total number of inbound packets discarded by this channel.'),
+    ('variable_rtp_audio_out_skip_packet_count',
+     'rtp_audio_out_skip_packets_total',
+     'Total number of outbound packets discarded by this channel.'),
+    ('variable_rtp_audio_in_jitter_packet_count',
+     'rtp_audio_in_jitter_packets_total',
+     'Total number of ? packets in this channel.'),
+    ('variable_rtp_audio_in_dtmf_packet_count',
+     'rtp_audio_in_dtmf_packets_total',
+     'Total number of ? packets in this channel.'),
+    ('variable_rtp_audio_out_dtmf_packet_count',
+     'rtp_audio_out_dtmf_packets_total',
+     'Total number of ? packets in this channel.'),
+    ('variable_rtp_audio_in_cng_packet_count',
+     'rtp_audio_in_cng_packets_total',
+     'Total number of ? packets in this channel.'),
+    ('variable_rtp_audio_out_cng_packet_count',
+     'rtp_audio_out_cng_packets_total',
+     'Total number of ? packets in this channel.'),
+    ('variable_rtp_audio_in_flush_packet_count',
+     'rtp_audio_in_flush_packets_total',
+     'Total number of ? packets in this channel.'),
+    ('variable_rtp_audio_in_largest_jb_size',
+     'rtp_audio_in_jitter_buffer_bytes_max',
+     'Largest jitterbuffer size in this channel.'),
+    ('variable_rtp_audio_in_jitter_min_variance',
+     'rtp_audio_in_jitter_seconds_min',
+     'Minimal jitter in seconds.'),
+    ('variable_rtp_audio_in_jitter_max_variance',
+     'rtp_audio_in_jitter_seconds_max',
+     'Maximum jitter in seconds.'),
+    ('variable_rtp_audio_in_jitter_loss_rate',
+     'rtp_audio_in_jitter_loss_rate',
+     'Ratio of lost packets due to inbound jitter.'),
+    ('variable_rtp_audio_in_jitter_burst_rate',
+     'rtp_audio_in_jitter_burst_rate',
+     'Ratio of packet bursts due to inbound jitter.'),
+    ('variable_rtp_audio_in_mean_interval',
+     'rtp_audio_in_mean_interval_seconds',
+     'Mean interval in seconds of inbound packets'),
+    ('variable_rtp_audio_in_flaw_total',
+     'rtp_audio_in_flaw_total',
+     'Total number of flaws detected in the channel'),
+    ('variable_rtp_audio_in_quality_percentage',
+     'rtp_audio_in_quality_percent',
+     'Audio quality in percent'),
+    ('variable_rtp_audio_in_mos',
+     'rtp_audio_in_quality_mos',
+     'Audio quality as Mean Opinion Score, (between 1 and 5)'),
+    ('variable_rtp_audio_rtcp_octet_count',
+     'rtcp_audio_bytes_total',
+     'Total number of rtcp bytes in this channel.'),
+    ('variable_rtp_audio_rtcp_packet_count',
+     'rtcp_audio_packets_total',
+     'Total number of rtcp packets in this channel.'),
+)
+
+# (SofiaProfileStatus attribute, metric name, help) of the per-profile gauges.
+_SOFIA_PROFILE_METRIC_DEFS = (
+    ("congestion",
+     "sofia_profile_congested_calls_total",
+     "How many calls were rejected for busy lines or other resource exhaustion on this Sofia profile."),
+    ("session_to",
+     "sofia_profile_session_timeout_total",
+     "How many calls were dropped for timeout causes on this Sofia profile."),
+    ("max_dialog",
+     "sofia_profile_maximum_sessions_configuration",
+     "How many sessions can be active at once on this Sofia profile before refusing calls for congestion."),
+    ("calls_in",
+     "sofia_profile_calls_inbound_total",
+     "How many calls were received inbound on this Sofia profile."),
+    ("failed_calls_in",
+     "sofia_profile_failed_inbound_calls_total",
+     "How many incoming calls couldn't be accepted by this Sofia profile."),
+    ("calls_out",
+     "sofia_profile_calls_outbound_total",
+     "How many calls were send by this Sofia profile."),
+    ("failed_calls_out",
+     "sofia_profile_failed_outbound_calls_total",
+     "How many outbound calls couldn't be completed by this Sofia profile."),
+    ("registrations",
+     "sofia_profile_registrations_total",
+     "How many clients are registered to this Sofia profile."),
+)
+
+# Matches the string members of a uuid_dump JSON object which are read by
+# ESLChannelInfo.
+_CHANNEL_VARIABLE_PATTERN = re.compile(
+    rb'"(%s)"\s*:\s*"((?:[^"\\]|\\.)*)"' % b'|'.join(
+        re.escape(key.encode())
+        for key in [key for (key, _, _) in _CHANNEL_METRIC_DEFS] + ['variable_sip_user_agent']))
+
+
+def scan_channel_variables(data: bytes):
+    """
+    Extract the exported channel variables from uuid_dump JSON output
+    without parsing the whole document.
+    """
+
+    return {
+        match.group(1).decode(): orjson.loads(b'"%s"' % match.group(2))
+        for match in _CHANNEL_VARIABLE_PATTERN.finditer(data)
+    }
+
+
 class ESLProcessInfo:
     """
     Process info async collector
     """
 
-    def __init__(self, esl: ESL):
-        self._esl = esl
+    def __init__(self, pool: ESLPool):
+        self._pool = pool
 
-    async def collect(self):
+    def commands(self):
+        """
+        Returns the commands whose responses are passed to parse().
+        """
+
+        return ['api json {"command" : "status", "data" : ""}']
+
+    async def parse(self, responses):
         """
         Collects FreeSWITCH process info metrics.
         """
 
-        (_, result) = await self._esl.send(
-            'api json {"command" : "status", "data" : ""}')
-        response = json.loads(result).get('response', {})
+        (_, result) = responses[0]
+        response = orjson.loads(result).get('response', {})
 
         process_info_metric = GaugeMetricFamily(
             'freeswitch_info',
             'FreeSWITCH info',
             labels=['version'])
         if 'version' in response:
-            process_info_metric.add_metric([response['version']], 1)
+            process_info_metric.add_metric((response['version'],), 1)
 
         process_status_metric = GaugeMetricFamily(
             'freeswitch_up',
@@ -55,7 +205,7 @@ class ESLProcessInfo:
         )
         if 'systemStatus' in response:
             status = int(response['systemStatus'] == 'ready')
-            process_status_metric.add_metric([], status)
+            process_status_metric.add_metric((), status)
 
         process_memory_metric = GaugeMetricFamily(
             'freeswitch_stack_bytes',
@@ -63,7 +213,7 @@ class ESLProcessInfo:
         )
         if 'stackSizeKB' in response:
             memory = response['stackSizeKB'].get('current', 0)
-            process_memory_metric.add_metric([], memory * 1024)
+            process_memory_metric.add_metric((), memory * 1024)
 
         process_session_metrics = []
         if 'sessions' in response:
@@ -74,7 +224,7 @@ class ESLProcessInfo:
                 )
 
                 value = response['sessions'].get('count', {}).get(metric, 0)
-                process_session_metric.add_metric([], value)
+                process_session_metric.add_metric((), value)
 
                 process_session_metrics.append(process_session_metric)
 
@@ -88,126 +238,40 @@ class ESLProcessInfo:
 class ESLChannelInfo:
     """
     Channel info async collector
+
+    Calls are scraped in batches spread over up to max_size connections from
+    the pool, requests within a batch are pipelined.
+
+    With scan_variables, only the exported variables are extracted from the
+    uuid_dump output instead of parsing the whole JSON document.
     """
 
-    def __init__(self, esl: ESL):
-        self._esl = esl
+    _MILLISECOND_METRICS = frozenset([
+        'variable_rtp_audio_in_jitter_min_variance',
+        'variable_rtp_audio_in_jitter_max_variance',
+        'variable_rtp_audio_in_mean_interval',
+    ])
+
+    def __init__(self, pool: ESLPool, scan_variables=False):
+        self._pool = pool
+        self._scan_variables = scan_variables
         self._log = logging.getLogger(__name__)
 
-    async def collect(self):
+    def commands(self):
+        """
+        Returns the commands whose responses are passed to parse().
+        """
+
+        return ['api show calls as json']
+
+    async def parse(self, responses):
         """
         Collects channel metrics.
         """
 
         channel_metrics = {
-            'variable_rtp_audio_in_raw_bytes': GaugeMetricFamily(
-                'rtp_audio_in_raw_bytes_total',
-                'Total number of bytes received via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_out_raw_bytes': GaugeMetricFamily(
-                'rtp_audio_out_raw_bytes_total',
-                'Total number of bytes sent via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_media_bytes': GaugeMetricFamily(
-                'rtp_audio_in_media_bytes_total',
-                'Total number of media bytes received via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_out_media_bytes': GaugeMetricFamily(
-                'rtp_audio_out_media_bytes_total',
-                'Total number of media bytes sent via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_packet_count': GaugeMetricFamily(
-                'rtp_audio_in_packets_total',
-                'Total number of packets received via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_out_packet_count': GaugeMetricFamily(
-                'rtp_audio_out_packets_total',
-                'Total number of packets sent via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_media_packet_count': GaugeMetricFamily(
-                'rtp_audio_in_media_packets_total',
-                'Total number of media packets received via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_out_media_packet_count': GaugeMetricFamily(
-                'rtp_audio_out_media_packets_total',
-                'Total number of media packets sent via this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_skip_packet_count': GaugeMetricFamily(
-                'rtp_audio_in_skip_packets_total',
-                'Total number of inbound packets discarded by this channel.',
-                labels=['id']),
-            'variable_rtp_audio_out_skip_packet_count': GaugeMetricFamily(
-                'rtp_audio_out_skip_packets_total',
-                'Total number of outbound packets discarded by this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_jitter_packet_count': GaugeMetricFamily(
-                'rtp_audio_in_jitter_packets_total',
-                'Total number of ? packets in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_dtmf_packet_count': GaugeMetricFamily(
-                'rtp_audio_in_dtmf_packets_total',
-                'Total number of ? packets in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_out_dtmf_packet_count': GaugeMetricFamily(
-                'rtp_audio_out_dtmf_packets_total',
-                'Total number of ? packets in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_cng_packet_count': GaugeMetricFamily(
-                'rtp_audio_in_cng_packets_total',
-                'Total number of ? packets in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_out_cng_packet_count': GaugeMetricFamily(
-                'rtp_audio_out_cng_packets_total',
-                'Total number of ? packets in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_flush_packet_count': GaugeMetricFamily(
-                'rtp_audio_in_flush_packets_total',
-                'Total number of ? packets in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_largest_jb_size': GaugeMetricFamily(
-                'rtp_audio_in_jitter_buffer_bytes_max',
-                'Largest jitterbuffer size in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_in_jitter_min_variance': GaugeMetricFamily(
-                'rtp_audio_in_jitter_seconds_min',
-                'Minimal jitter in seconds.',
-                labels=['id']),
-            'variable_rtp_audio_in_jitter_max_variance': GaugeMetricFamily(
-                'rtp_audio_in_jitter_seconds_max',
-                'Maximum jitter in seconds.',
-                labels=['id']),
-            'variable_rtp_audio_in_jitter_loss_rate': GaugeMetricFamily(
-                'rtp_audio_in_jitter_loss_rate',
-                'Ratio of lost packets due to inbound jitter.',
-                labels=['id']),
-            'variable_rtp_audio_in_jitter_burst_rate': GaugeMetricFamily(
-                'rtp_audio_in_jitter_burst_rate',
-                'Ratio of packet bursts due to inbound jitter.',
-                labels=['id']),
-            'variable_rtp_audio_in_mean_interval': GaugeMetricFamily(
-                'rtp_audio_in_mean_interval_seconds',
-                'Mean interval in seconds of inbound packets',
-                labels=['id']),
-            'variable_rtp_audio_in_flaw_total': GaugeMetricFamily(
-                'rtp_audio_in_flaw_total',
-                'Total number of flaws detected in the channel',
-                labels=['id']),
-            'variable_rtp_audio_in_quality_percentage': GaugeMetricFamily(
-                'rtp_audio_in_quality_percent',
-                'Audio quality in percent',
-                labels=['id']),
-            'variable_rtp_audio_in_mos': GaugeMetricFamily(
-                'rtp_audio_in_quality_mos',
-                'Audio quality as Mean Opinion Score, (between 1 and 5)',
-                labels=['id']),
-            'variable_rtp_audio_rtcp_octet_count': GaugeMetricFamily(
-                'rtcp_audio_bytes_total',
-                'Total number of rtcp bytes in this channel.',
-                labels=['id']),
-            'variable_rtp_audio_rtcp_packet_count': GaugeMetricFamily(
-                'rtcp_audio_packets_total',
-                'Total number of rtcp packets in this channel.',
-                labels=['id']),
+            key: GaugeMetricFamily(name, documentation, labels=['id'])
+            for (key, name, documentation) in _CHANNEL_METRIC_DEFS
         }
 
         channel_info_metric = GaugeMetricFamily(
@@ -215,113 +279,128 @@ class ESLChannelInfo:
             'FreeSWITCH RTP channel info',
             labels=['id', 'name', 'user_agent'])
 
-        millisecond_metrics = [
-            'variable_rtp_audio_in_jitter_min_variance',
-            'variable_rtp_audio_in_jitter_max_variance',
-            'variable_rtp_audio_in_mean_interval',
-        ]
-
         # This loop is potentially running while calls are being dropped and
         # new calls are established. This will lead to some failing api
         # requests. In that case it is better to just skip scraping for that
         # call and continue with the next one in order to avoid failing the
         # whole scrape.
-        (_, result) = await self._esl.send('api show calls as json')
-        for row in json.loads(result).get('rows', []):
-            uuid = row['uuid']
+        (_, result) = responses[0]
+        rows = orjson.loads(result).get('rows', [])
+
+        batches = _split(rows, self._pool.max_size)
+        results = await asyncio.gather(
+            *(self._scrape_batch(batch) for batch in batches),
+            return_exceptions=True)
+
+        responses = []
+        for batch, result in zip(batches, results):
+            if isinstance(result, Exception):
+                self._log.warning(
+                    "Got error while scraping call stats for %d calls: %s",
+                    len(batch),
+                    result
+                )
+                continue
 
-            await self._esl.send('api uuid_set_media_stats %s' % (uuid,))
-            (_, result) = await self._esl.send('api uuid_dump %s json' % (uuid,))
+            responses.extend(zip(batch, result))
+
+        # Resolve the bound add_metric methods once for the whole loop.
+        add_channel_metric = {
+            key: metric.add_metric for (key, metric) in channel_metrics.items()
+        }
+        add_channel_info = channel_info_metric.add_metric
+        millisecond_metrics = self._MILLISECOND_METRICS
 
-            if result.startswith("-ERR "):
+        for row, result in responses:
+            uuid = row['uuid']
+
+            if result.startswith(b"-ERR "):
                 self._log.debug(
                     "Got error while scraping call stats for %s: %s",
                     uuid,
-                    result.strip()
+                    result.decode().strip()
                 )
                 continue
 
-            channel_vars = json.loads(result)
+            if self._scan_variables:
+                channel_vars = scan_channel_variables(result)
+            else:
+                channel_vars = orjson.loads(result)
 
-            label_values = [uuid]
-            for key, metric_value in channel_vars.items():
+            label_values = (uuid,)
+            for key in channel_vars.keys() & add_channel_metric.keys():
+                metric_value = float(channel_vars[key])
                 if key in millisecond_metrics:
-                    metric_value = float(metric_value) / 1000.
-                if key in channel_metrics:
-                    channel_metrics[key].add_metric(
-                        label_values, metric_value)
+                    metric_value /= 1000.
+                add_channel_metric[key](label_values, metric_value)
 
             user_agent = channel_vars.get('variable_sip_user_agent', 'Unknown')
-            channel_info_label_values = [uuid, row['name'], user_agent]
-            channel_info_metric.add_metric(
-                channel_info_label_values, 1)
+            add_channel_info((uuid, row['name'], user_agent), 1)
 
         return itertools.chain(
             channel_metrics.values(),
             [channel_info_metric])
 
+    async def _scrape_batch(self, rows):
+        # Pipeline all requests, each uuid_dump directly follows the
+        # uuid_set_media_stats for the same call.
+        commands = []
+        for row in rows:
+            commands.append('api uuid_set_media_stats %s' % (row['uuid'],))
+            commands.append('api uuid_dump %s json' % (row['uuid'],))
+
+        async with self._pool.acquire() as esl:
+            responses = await esl.send_many(commands)
+
+        return [body for (_, body) in responses[1::2]]
+
 
 class ESLSofiaStatusCollector:
-    def __init__(self, esl: ESL):
-        self._esl = esl
+    def __init__(self, pool: ESLPool):
+        self._pool = pool
         self._log = logging.getLogger(__name__)
 
-    async def collect(self):
-        gauges = []
+    def commands(self):
+        """
+        Returns the commands whose responses are passed to parse().
+        """
+
+        return ['api sofia status']
+
+    async def parse(self, responses):
+        """
+        Collects Sofia profile metrics.
+        """
+
         sofia_profile_status_fields = {
-            "congestion": GaugeMetricFamily(
-                "sofia_profile_congested_calls_total",
-                "How many calls were rejected for busy lines or other resource exhaustion on this Sofia profile.",
-                labels=["name"],
-            ),
-            "session_to": GaugeMetricFamily(
-                "sofia_profile_session_timeout_total",
-                "How many calls were dropped for timeout causes on this Sofia profile.",
-                labels=["name"],
-            ),
-            "max_dialog": GaugeMetricFamily(
-                "sofia_profile_maximum_sessions_configuration",
-                "How many sessions can be active at once on this Sofia profile before refusing calls for congestion.",
-                labels=["name"],
-            ),
-            "calls_in": GaugeMetricFamily(
-                "sofia_profile_calls_inbound_total",
-                "How many calls were received inbound on this Sofia profile.",
-                labels=["name"],
-            ),
-            "failed_calls_in": GaugeMetricFamily(
-                "sofia_profile_failed_inbound_calls_total",
-                "How many incoming calls couldn't be accepted by this Sofia profile.",
-                labels=["name"],
-            ),
-            "calls_out": GaugeMetricFamily(
-                "sofia_profile_calls_outbound_total",
-                "How many calls were send by this Sofia profile.",
-                labels=["name"],
-            ),
-            "failed_calls_out": GaugeMetricFamily(
-                "sofia_profile_failed_outbound_calls_total",
-                "How many outbound calls couldn't be completed by this Sofia profile.",
-                labels=["name"],
-            ),
-            "registrations": GaugeMetricFamily(
-                "sofia_profile_registrations_total",
-                "How many clients are registered to this Sofia profile.",
-                labels=["name"],
-            ),
+            field: GaugeMetricFamily(name, documentation, labels=["name"])
+            for (field, name, documentation) in _SOFIA_PROFILE_METRIC_DEFS
         }
 
-        (_, sofia_status_data) = await self._esl.send('api sofia status')
+        (_, sofia_status_data) = responses[0]
+        profiles = list(SofiaProfile.profile_list_from_sofia_status(sofia_status_data.decode()))
 
-        for profile in SofiaProfile.profile_list_from_sofia_status(sofia_status_data):
-            (_, sofia_profile_status_data) = await self._esl.send('api sofia status profile %s' % profile.name)
-            sofia_profile_status = SofiaProfileStatus(sofia_profile_status_data)
+        results = await asyncio.gather(*(
+            self._fetch_profiles(batch)
+            for batch in _split(profiles, self._pool.max_size)))
+
+        add_profile_metrics = [
+            (name, gauge.add_metric) for (name, gauge) in sofia_profile_status_fields.items()
+        ]
 
-            for name, gauge in sofia_profile_status_fields.items():
-                gauge.add_metric([sofia_profile_status.name], getattr(sofia_profile_status, name))
-                gauges.append(gauge)
+        for (_, sofia_profile_status_data) in itertools.chain.from_iterable(results):
+            sofia_profile_status = SofiaProfileStatus(sofia_profile_status_data.decode())
 
-        return gauges
+            label_values = (sofia_profile_status.name,)
+            for name, add_metric in add_profile_metrics:
+                add_metric(label_values, getattr(sofia_profile_status, name))
+
+        return sofia_profile_status_fields.values()
+
+    async def _fetch_profiles(self, profiles):
+        async with self._pool.acquire() as esl:
+            return await esl.send_many(
+                ['api sofia status profile %s' % profile.name for profile in profiles])
 
 
 class ChannelCollector:
@@ -333,39 +412,67 @@ class ChannelCollector:
     freeswitch_version_info{release="15",repoid="7599e35a",version="4.4"} 1.0
     """
 
-    def __init__(self, host, port, password):
-        self._host = host
-        self._port = port
-        self._password = password
+    def __init__(self, pool: ESLPool, loop: asyncio.AbstractEventLoop, timeout=None,
+                 scan_variables=False):
+        self._pool = pool
+        self._loop = loop
+        self._timeout = timeout
+        self._scan_variables = scan_variables
 
     def collect(self):  # pylint: disable=missing-docstring
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        return loop.run_until_complete(self._collect())
+        future = asyncio.run_coroutine_threadsafe(self._collect(), self._loop)
+        try:
+            return future.result(self._timeout)
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            raise
 
     async def _collect(self):
-        reader, writer = await asyncio.open_connection(self._host, self._port)
-        try:
-            esl = ESL(reader, writer)
-            await esl.initialize()
-            await esl.login(self._password)
+        collectors = [
+            ESLProcessInfo(self._pool),
+            ESLChannelInfo(self._pool, self._scan_variables),
+            ESLSofiaStatusCollector(self._pool),
+        ]
+
+        # Send the initial commands of all collectors in a single batch, the
+        # collectors then issue their follow-up requests concurrently.
+        commands = [collector.commands() for collector in collectors]
+        async with self._pool.acquire() as esl:
+            responses = await esl.send_many(list(itertools.chain.from_iterable(commands)))
+
+        parsers = []
+        for collector, collector_commands in zip(collectors, commands):
+            parsers.append(collector.parse(responses[:len(collector_commands)]))
+            responses = responses[len(collector_commands):]
+
+        return list(itertools.chain.from_iterable(await asyncio.gather(*parsers)))
+
+
+class MetricFamilyCollector:
+    """
+    Exposes a single, already collected metric family.
+    """
 
-            return itertools.chain(
-                await ESLProcessInfo(esl).collect(),
-                await ESLChannelInfo(esl).collect(),
-                await ESLSofiaStatusCollector(esl).collect(),
-            )
+    def __init__(self, metric):
+        self._metric = metric
+
+    def collect(self):  # pylint: disable=missing-docstring
+        return [self._metric]
 
-        finally:
-            writer.close()
 
+def collect_esl(pool, loop, timeout=None, scan_variables=False):
+    """
+    Scrape a host and return its metric families. Blocks the calling thread
+    while the scrape runs on the given event loop, for at most timeout
+    seconds (scrape_timeout) after which the scrape is cancelled and
+    concurrent.futures.TimeoutError is raised.
+    """
+
+    return ChannelCollector(pool, loop, timeout, scan_variables).collect()
 
-def collect_esl(config, host):
-    """Scrape a host and return prometheus text format for it (async)"""
 
-    port = config.get('port', 8021)
-    password = config.get('password', 'ClueCon')
+def render_esl(metrics):
+    """Yield prometheus text format for metric families, one family at a time"""
 
-    registry = CollectorRegistry()
-    registry.register(ChannelCollector(host, port, password))
-    return generate_latest(registry)
+    for metric in metrics:
+        yield generate_latest(MetricFamilyCollector(metric))
@@ -3,8 +3,11 @@ Simple FreeSWITCH inbound event socket implementation based on asyncio
 """
 
 import asyncio
+import contextlib
 import logging
-from typing import Dict, Tuple
+import socket
+import time
+from typing import AsyncIterator, Dict, List, Tuple
 
 
 class ESLError(Exception):
@@ -37,6 +40,12 @@ class ESL:
         self._out = writer
         self._log = logging.getLogger('esl')
 
+    def close(self):
+        """
+        Close the underlying connection.
+        """
+        self._out.close()
+
     async def initialize(self):
         """
         Initialize an ESL connection, wait for auth/request.
@@ -57,7 +66,8 @@ class ESL:
         result = False
 
         self._log.info("Login: Send password")
-        await self._write('auth %s' % (password,))
+        self._queue_write('auth %s' % (password,))
+        await self._flush()
 
         self._log.debug("Expect command/reply")
         headers = await self._read_headers()
@@ -67,7 +77,7 @@ class ESL:
             self._log.debug("Received command/reply")
             result = True
         elif headers["Content-Type"] == "text/rude-rejection":
-            self._log.error("Received text/rude-rejection: %s", body)
+            self._log.error("Received text/rude-rejection: %s", body.decode())
         else:
             raise ESLProtocolError("Expected auth response, "
                                    "but got %s" % (repr(headers),))
@@ -75,16 +85,33 @@ class ESL:
         self._log.info("Login: %s", "success" if result else "failure")
         return result
 
-    async def send(self, command: str) -> Tuple[Dict[str, str], str]:
+    async def send(self, command: str) -> Tuple[Dict[str, str], bytes]:
         """
         Send command to FreeSWITCH. Returns a tuple (headers, body).
         """
-        body = ""
-        headers = {}
 
         self._log.debug("Send %s", command)
-        await self._write(command)
+        self._queue_write(command)
+        await self._flush()
+
+        return await self._read_api_response()
+
+    async def send_many(self, commands: List[str]) -> List[Tuple[Dict[str, str], bytes]]:
+        """
+        Send a batch of commands to FreeSWITCH without waiting for the
+        individual responses. Returns a list of tuples (headers, body) in the
+        same order as the commands.
+        """
+
+        for command in commands:
+            self._log.debug("Send %s", command)
+            self._queue_write(command)
+        await self._flush()
 
+        # FreeSWITCH answers api commands on an inbound socket in order.
+        return [await self._read_api_response() for _ in commands]
+
+    async def _read_api_response(self) -> Tuple[Dict[str, str], bytes]:
         self._log.debug("Expect api/response")
         headers = await self._read_headers()
         body = await self._read_body(headers)
@@ -95,31 +122,189 @@ class ESL:
 
         return headers, body
 
-    async def _write(self, command: str):
+    def _queue_write(self, command: str):
+        # Only buffers the command in the transport, see _flush().
         self._out.write(b'%s\n\n' % command.encode())
+
+    async def _flush(self):
         await self._out.drain()
 
     async def _read_headers(self):
         headers = {}
 
-        while True:
-            line = await self._in.readline()
-            if len(line) == 0 or line[-1:] != b"\n":
-                raise ESLHeaderError("Encountered EOF "
-                                     "while reading response headers")
-            if line == b"\n":
-                break
+        try:
+            data = await self._in.readuntil(b"\n\n")
+        except asyncio.IncompleteReadError as error:
+            raise ESLHeaderError("Encountered EOF "
+                                 "while reading response headers") from error
+        except asyncio.LimitOverrunError as error:
+            raise ESLHeaderError("Response headers exceed buffer limit") from error
+
+        for line in data.split(b"\n"):
+            if not line:
+                continue
 
-            name, value = line.decode().split(":", 1)
-            headers[name.strip()] = value.strip()
+            name, _, value = line.partition(b":")
+            headers[name.strip().decode()] = value.strip().decode()
 
         return headers
 
-    async def _read_body(self, headers: Dict[str, str]) -> str:
-        result = ""
+    async def _read_body(self, headers: Dict[str, str]) -> bytes:
+        result = b""
 
         if "Content-Length" in headers:
             size = int(headers["Content-Length"])
-            result = (await self._in.readexactly(size)).decode()
+            result = await self._in.readexactly(size)
 
         return result
+
+class ESLPool:
+    """
+    Pool of authenticated ESL connections to a single FreeSWITCH instance.
+
+    Connections are opened lazily and kept open between scrapes. Connections
+    idle for more than ping_after seconds are probed with `api status` before
+    they are handed out again and dropped if the probe fails.
+    """
+
+    def __init__(self, host: str, port: int, password: str,
+                 min_size: int = 1, max_size: int = 4, ping_after: float = 5.0):
+        self.host = host
+        self.port = port
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.ping_after = ping_after
+        self._password = password
+        self._size = 0
+        self._closed = False
+        self._idle = None
+        self._semaphore = None
+        self._log = logging.getLogger('esl')
+
+    @contextlib.asynccontextmanager
+    async def acquire(self) -> AsyncIterator[ESL]:
+        """
+        Borrow a connection from the pool. The connection is returned to the
+        pool on success and closed if an exception is raised.
+        """
+        # Created lazily so that the queue and semaphore bind to the loop
+        # running the collectors rather than the thread constructing the pool.
+        if self._semaphore is None:
+            self._idle = asyncio.Queue()
+            self._semaphore = asyncio.Semaphore(self.max_size)
+
+        async with self._semaphore:
+            esl = await self._get()
+            try:
+                yield esl
+            except BaseException:
+                self._discard(esl)
+                raise
+            if self._closed:
+                self._discard(esl)
+            else:
+                self._release(esl)
+
+    def close(self):
+        """
+        Close all idle connections. Borrowed connections are closed when they
+        are returned.
+        """
+
+        self._closed = True
+        while self._idle is not None and not self._idle.empty():
+            entry = self._idle.get_nowait()
+            if entry is not None:
+                entry[1].close()
+                self._size -= 1
+
+    async def _get(self) -> ESL:
+        while True:
+            if self._idle.empty() and self._size < self.max_size:
+                esl = await self._open()
+                break
+
+            # All max_size connections are open, at least one of them is
+            # being warmed up and will be queued (or discarded) shortly.
+            entry = await self._idle.get()
+            if entry is None:
+                continue
+
+            released, esl = entry
+            if time.monotonic() - released < self.ping_after:
+                return esl
+
+            try:
+                alive = await self._ping(esl)
+            except BaseException:
+                self._discard(esl)
+                raise
+
+            if alive:
+                return esl
+            self._discard(esl)
+
+        # Warm up the pool on first use so that the next scrape finds
+        # min_size connections ready.
+        try:
+            while self._size < self.min_size:
+                self._release(await self._open())
+        except (ESLError, OSError, asyncio.IncompleteReadError) as error:
+            self._log.warning("Failed to warm up connections to %s:%d: %s",
+                              self.host, self.port, error)
+        except BaseException:
+            self._discard(esl)
+            raise
+
+        return esl
+
+    async def _open(self) -> ESL:
+        # Count the connection before connecting, so that concurrent callers
+        # never open more than max_size connections in total.
+        self._size += 1
+        try:
+            return await self._connect()
+        except BaseException:
+            self._size -= 1
+            self._idle.put_nowait(None)
+            raise
+
+    def _release(self, esl: ESL):
+        self._idle.put_nowait((time.monotonic(), esl))
+
+    def _discard(self, esl: ESL):
+        esl.close()
+        self._size -= 1
+        # Wake up a caller waiting for a connection, it may open a new one.
+        self._idle.put_nowait(None)
+
+    async def _connect(self) -> ESL:
+        self._log.debug("Connect to %s:%d", self.host, self.port)
+        reader, writer = await asyncio.open_connection(self.host, self.port)
+
+        # Do not hold back pipelined commands waiting for ACKs. The receive
+        # buffer is left to kernel autotuning.
+        sock = writer.get_extra_info('socket')
+        if sock is not None:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        esl = ESL(reader, writer)
+        try:
+            await esl.initialize()
+            if not await esl.login(self._password):
+                raise ESLProtocolError("Login to %s:%d failed" % (self.host, self.port))
+        except BaseException:
+            esl.close()
+            raise
+
+        return esl
+
+    async def _ping(self, esl: ESL) -> bool:
+        try:
+            await esl.send('api status')
+        except (ESLError, OSError, asyncio.IncompleteReadError) as error:
+            self._log.info("Dropping dead connection to %s:%d: %s",
+                           self.host, self.port, error)
+            return False
+
+        return True
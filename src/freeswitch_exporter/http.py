@@ -4,17 +4,36 @@ HTTP API for FreeSWITCH prometheus collector.
 
 import asyncio
 import logging
+import threading
 import time
 import yaml
 
 from prometheus_client import CONTENT_TYPE_LATEST, Summary, Counter, generate_latest
-from werkzeug.exceptions import InternalServerError
-from werkzeug.routing import Map, Rule
+from werkzeug.exceptions import HTTPException, InternalServerError, NotFound
 from werkzeug.serving import run_simple
 from werkzeug.wrappers import Request, Response
 
-from freeswitch_exporter.collector import collect_esl
+from freeswitch_exporter.collector import collect_esl, render_esl
+from freeswitch_exporter.esl import ESLPool
 
+try:
+    import uvloop
+except ImportError:
+    uvloop = None
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:
+    from yaml import SafeLoader
+
+
+_INDEX_HTML = b"""<html>
+    <head><title>FreeSWITCH Exporter</title></head>
+    <body>
+    <h1>FreeSWITCH Exporter</h1>
+    <p>Visit <code>/esl?target=1.2.3.4</code> to use.</p>
+    </body>
+    </html>"""
 
 class FreeswitchExporterApplication:
     """
@@ -23,75 +42,161 @@ class FreeswitchExporterApplication:
 
     # pylint: disable=no-self-use
 
-    def __init__(self, config, duration, errors):
+    def __init__(self, config, duration, errors, loop):
         self._config = config
         self._duration = duration
         self._errors = errors
-        self._loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self._loop)
+        self._loop = loop
+        self._pools = {}
+        self._cache = {}
+        self._cache_locks = {}
 
         self._log = logging.getLogger(__name__)
 
-        self._url_map = Map([
-            Rule('/', endpoint='index'),
-            Rule('/metrics', endpoint='metrics'),
-            Rule('/esl', endpoint='esl'),
-        ])
-
         self._args = {
-            'esl': ['module', 'target']
+            '/esl': ['module', 'target']
         }
 
         self._views = {
-            'index': self.on_index,
-            'metrics': self.on_metrics,
-            'esl': self.on_esl,
+            '/': self.on_index,
+            '/metrics': self.on_metrics,
+            '/esl': self.on_esl,
         }
 
-    def on_esl(self, environ, start_response):
+    def on_esl(self, module='default', target='localhost'):
         """
         Request handler for /esl route
         """
-        start = time.time()
-        response = collect_esl({}, 'localhost')
-        start_response("200 OK", [('content-type', CONTENT_TYPE_LATEST)])
-        yield response
 
-    def on_metrics(self, environ, start_response):
+        if module not in self._config:
+            raise NotFound("Unknown module %s" % (module,))
+
+        chunks = self._collect_cached(module, self._config[module], target)
+
+        return Response(chunks, content_type=CONTENT_TYPE_LATEST)
+
+    def _collect_cached(self, module, config, host):
+        """
+        Scrape a host unless it was scraped less than cache_ttl seconds ago
+        and return the rendered metric families. Concurrent requests for the
+        same module and host wait for a single scrape.
+        """
+
+        key = (module, host, config.get('port', 8021))
+        ttl = config.get('cache_ttl', 0.5)
+
+        # Fresh results are served straight from the worker thread, only
+        # cache misses wait for the lock and the ESL event loop.
+        timestamp, chunks = self._cache.get(key, (None, None))
+        if timestamp is not None and time.monotonic() - timestamp < ttl:
+            return chunks
+
+        lock = self._cache_locks.get(key)
+        if lock is None:
+            lock = self._cache_locks.setdefault(key, threading.Lock())
+
+        with lock:
+            timestamp, chunks = self._cache.get(key, (None, None))
+            if timestamp is None or time.monotonic() - timestamp >= ttl:
+                start = time.time()
+                metrics = collect_esl(self._pool(module, config, host), self._loop,
+                                      config.get('scrape_timeout', 10),
+                                      config.get('scan_uuid_dump', False))
+                self._duration.labels(module).observe(time.time() - start)
+                # Rendered once per scrape, every request within cache_ttl
+                # streams the same chunks.
+                chunks = list(render_esl(metrics))
+                self._prune_cache(time.monotonic())
+                self._cache[key] = (time.monotonic(), chunks)
+
+        return chunks
+
+    def _prune_cache(self, now):
+        """
+        Drop expired scrape results and the locks of targets not being
+        scraped, so that targets that are no longer requested are forgotten.
+        """
+
+        for key, (timestamp, _) in list(self._cache.items()):
+            if now - timestamp < self._config[key[0]].get('cache_ttl', 0.5):
+                continue
+
+            self._cache.pop(key, None)
+            lock = self._cache_locks.get(key)
+            if lock is not None and not lock.locked():
+                self._cache_locks.pop(key, None)
+
+    def _pool(self, module, config, host):
+        """
+        Return the ESL connection pool for the given module and target.
+        """
+
+        # Pools are not shared between modules, their connections are
+        # authenticated with the module's password.
+        port = config.get('port', 8021)
+        key = (module, host, port)
+        now = time.monotonic()
+
+        # Taking the pool out of the mapping keeps it from being evicted by a
+        # concurrent request for another target.
+        _, pool = self._pools.pop(key, (None, None))
+        self._evict_pools(now)
+        if pool is None:
+            pool = ESLPool(
+                host, port,
+                config.get('password', 'ClueCon'),
+                config.get('pool_min_size', 1),
+                config.get('pool_max_size', 4),
+                config.get('pool_ping_after', 5),
+            )
+        self._pools[key] = (now, pool)
+
+        return pool
+
+    def _evict_pools(self, now):
+        """
+        Close the pools of targets that were not scraped for pool_idle_timeout
+        seconds.
+        """
+
+        for key, (last_used, _) in list(self._pools.items()):
+            if now - last_used < self._config[key[0]].get('pool_idle_timeout', 300):
+                continue
+
+            _, pool = self._pools.pop(key, (None, None))
+            if pool is not None:
+                self._log.debug("Closing idle ESL pool for %s:%d", pool.host, pool.port)
+                self._loop.call_soon_threadsafe(pool.close)
+
+    def on_metrics(self):
         """
         Request handler for /metrics route
         """
 
-        start_response("200 OK", [('content-type', CONTENT_TYPE_LATEST)])
-        response = generate_latest()
-        yield response
+        return Response(generate_latest(), content_type=CONTENT_TYPE_LATEST)
 
-    def on_index(self, environ, start_response):
+    def on_index(self):
         """
         Request handler for index route (/).
         """
 
-        start_response("200 OK", [('content-type', 'text/html')])
-        yield b"""<html>
-            <head><title>FreeSWITCH Exporter</title></head>
-            <body>
-            <h1>FreeSWITCH Exporter</h1>
-            <p>Visit <code>/esl?target=1.2.3.4</code> to use.</p>
-            </body>
-            </html>"""
+        return Response(_INDEX_HTML, content_type='text/html')
 
-    def view(self, endpoint, values, args):
+    def view(self, path, args):
         """
-        Werkzeug views mapping method.
+        Views mapping method.
         """
 
-        params = dict(values)
-        if endpoint in self._args:
-            params.update({key: args[key] for key in self._args[endpoint] if key in args})
+        view = self._views.get(path)
+        if view is None:
+            raise NotFound()
+
+        params = {key: args[key] for key in self._args.get(path, ()) if key in args}
 
         try:
-            return self._views[endpoint]
-            return self._views[endpoint](**params)
+            return view(**params)
+        except HTTPException:
+            raise
         except Exception as error:  # pylint: disable=broad-except
             self._log.exception("Exception thrown while rendering view")
             self._errors.labels(args.get('module', 'default')).inc()
@@ -99,9 +204,10 @@ class FreeswitchExporterApplication:
 
     @Request.application
     def __call__(self, request):
-        urls = self._url_map.bind_to_environ(request.environ)
-        view_func = lambda endpoint, values: self.view(endpoint, values, request.args)
-        return urls.dispatch(view_func, catch_http_exceptions=True)
+        try:
+            return self.view(request.path, request.args)
+        except HTTPException as error:
+            return error
 
 
 def start_http_server(config_path, port, address=''):
@@ -122,7 +228,7 @@ def start_http_server(config_path, port, address=''):
 
     # Load configuration.
     with open(config_path) as handle:
-        config = yaml.safe_load(handle)
+        config = yaml.load(handle, Loader=SafeLoader)
 
     # Initialize metrics.
     for module in config.keys():
@@ -131,5 +237,10 @@ def start_http_server(config_path, port, address=''):
         # pylint: disable=no-member
         duration.labels(module)
 
-    app = FreeswitchExporterApplication(config, duration, errors)
+    # All ESL connections are served by a single event loop running in a
+    # background thread for the lifetime of the process.
+    loop = uvloop.new_event_loop() if uvloop else asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    app = FreeswitchExporterApplication(config, duration, errors, loop)
     run_simple(address, port, app, threaded=True)
@@ -0,0 +1,167 @@
+import asyncio
+import contextlib
+from unittest import IsolatedAsyncioTestCase, TestCase
+import orjson
+from freeswitch_exporter.collector import ESLChannelInfo, ESLSofiaStatusCollector, \
+    scan_channel_variables
+from freeswitch_exporter.esl import ESL
+from freeswitch_exporter.tests.test_esl import FakeWriter, api_response
+from freeswitch_exporter.tests.test_sofia_status import sofia_profiles, sofia_profile_status
+
+
+class FakePool:
+
+    max_size = 3
+
+    def __init__(self, data: bytes):
+        self._data = data
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        reader = asyncio.StreamReader()
+        reader.feed_data(self._data)
+        reader.feed_eof()
+        yield ESL(reader, FakeWriter())
+
+
+class FakeChannelWriter(FakeWriter):
+    """
+    Answers pipelined uuid_set_media_stats and uuid_dump commands once they
+    are flushed. A channel without a dump closes the connection.
+    """
+
+    def __init__(self, reader, dumps):
+        super().__init__()
+        self.commands = []
+        self._reader = reader
+        self._dumps = dumps
+
+    async def drain(self):
+        await super().drain()
+        commands = self.data.decode().split('\n\n')[:-1]
+        self.commands.extend(commands)
+        self.data = b''
+
+        for command in commands:
+            (_, name, uuid, *_) = command.split()
+            if name == 'uuid_set_media_stats':
+                self._reader.feed_data(api_response(b'+OK\n'))
+            elif self._dumps[uuid] is None:
+                self._reader.feed_eof()
+                return
+            else:
+                self._reader.feed_data(api_response(self._dumps[uuid]))
+
+
+class FakeChannelPool:
+
+    max_size = 3
+
+    def __init__(self, dumps):
+        self.writers = []
+        self._dumps = dumps
+
+    @contextlib.asynccontextmanager
+    async def acquire(self):
+        reader = asyncio.StreamReader()
+        writer = FakeChannelWriter(reader, self._dumps)
+        self.writers.append(writer)
+        yield ESL(reader, writer)
+
+
+class TestESLChannelInfo(IsolatedAsyncioTestCase):
+
+    dumps = {
+        'call-1': orjson.dumps({
+            'variable_rtp_audio_in_raw_bytes': '1024',
+            'variable_rtp_audio_in_mean_interval': '20',
+            'variable_sip_user_agent': 'Phone',
+        }),
+        'call-2': b'-ERR No such channel!\n',
+        'call-3': None,
+        'call-4': orjson.dumps({'variable_rtp_audio_in_raw_bytes': '1'}),
+        'call-5': orjson.dumps({'variable_rtp_audio_in_raw_bytes': '2048'}),
+    }
+
+    async def _collect(self, scan_variables):
+        pool = FakeChannelPool(self.dumps)
+        collector = ESLChannelInfo(pool, scan_variables)
+        rows = [{'uuid': uuid, 'name': 'sofia/%s' % (uuid,)} for uuid in self.dumps]
+        calls = orjson.dumps({'row_count': len(rows), 'rows': rows})
+
+        metrics = await collector.parse([({}, calls)])
+        samples = {
+            (metric.name, sample.labels['id']): sample
+            for metric in metrics for sample in metric.samples
+        }
+        return pool, samples
+
+    async def test_calls_are_batched_over_connections(self):
+        pool, _ = await self._collect(False)
+
+        self.assertEqual([writer.commands for writer in pool.writers], [
+            ['api uuid_set_media_stats call-1', 'api uuid_dump call-1 json',
+             'api uuid_set_media_stats call-2', 'api uuid_dump call-2 json'],
+            ['api uuid_set_media_stats call-3', 'api uuid_dump call-3 json',
+             'api uuid_set_media_stats call-4', 'api uuid_dump call-4 json'],
+            ['api uuid_set_media_stats call-5', 'api uuid_dump call-5 json'],
+        ])
+        for writer in pool.writers:
+            self.assertEqual(writer.drained, 1)
+
+    async def test_channel_metrics(self):
+        for scan_variables in (False, True):
+            with self.subTest(scan_variables=scan_variables):
+                _, samples = await self._collect(scan_variables)
+
+                self.assertEqual(
+                    samples['rtp_audio_in_raw_bytes_total', 'call-1'].value, 1024)
+                self.assertEqual(
+                    samples['rtp_audio_in_mean_interval_seconds', 'call-1'].value, 0.02)
+                self.assertEqual(
+                    samples['rtp_channel_info', 'call-1'].labels['user_agent'], 'Phone')
+                self.assertEqual(
+                    samples['rtp_audio_in_raw_bytes_total', 'call-5'].value, 2048)
+                self.assertEqual(
+                    samples['rtp_channel_info', 'call-5'].labels['user_agent'], 'Unknown')
+
+                # call-2 answered -ERR, the connection of call-3 and call-4 failed.
+                self.assertEqual({uuid for (_, uuid) in samples}, {'call-1', 'call-5'})
+
+
+class TestESLSofiaStatusCollector(IsolatedAsyncioTestCase):
+
+    async def test_each_gauge_is_returned_once(self):
+        profile_count = 7
+        pool = FakePool(api_response(sofia_profile_status.encode()) * profile_count)
+        collector = ESLSofiaStatusCollector(pool)
+
+        (command,) = collector.commands()
+        self.assertEqual(command, 'api sofia status')
+
+        metrics = list(await collector.parse([({}, sofia_profiles.encode())]))
+        names = [metric.name for metric in metrics]
+
+        self.assertEqual(len(names), len(set(names)))
+        for metric in metrics:
+            self.assertEqual(len(metric.samples), profile_count)
+
+
+class TestScanChannelVariables(TestCase):
+
+    def test_matches_json_parse(self):
+        channel_vars = {
+            'Unique-ID': 'a3c9b4a2',
+            'variable_rtp_audio_in_mos': '4.50',
+            'variable_rtp_audio_in_raw_bytes': '1024',
+            'variable_rtp_audio_in_raw_bytes_extra': '1',
+            'variable_sip_user_agent': 'Phone "1.0" \\ \u00e9',
+            'variable_other': '"variable_rtp_audio_in_packet_count": "12"',
+        }
+        data = orjson.dumps(channel_vars)
+
+        self.assertEqual(scan_channel_variables(data), {
+            'variable_rtp_audio_in_mos': '4.50',
+            'variable_rtp_audio_in_raw_bytes': '1024',
+            'variable_sip_user_agent': 'Phone "1.0" \\ \u00e9',
+        })
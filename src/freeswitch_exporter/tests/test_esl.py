@@ -0,0 +1,180 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, mock
+from freeswitch_exporter.esl import ESL, ESLHeaderError, ESLPool
+
+
+class FakeWriter:
+
+    def __init__(self):
+        self.data = b''
+        self.drained = 0
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        self.drained += 1
+
+    def close(self):
+        pass
+
+
+def api_response(body: bytes) -> bytes:
+    return b'Content-Type: api/response\nContent-Length: %d\n\n%s' % (len(body), body)
+
+
+class TestESL(IsolatedAsyncioTestCase):
+
+    def _esl(self, data: bytes):
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        writer = FakeWriter()
+        return ESL(reader, writer), writer
+
+    async def test_send(self):
+        esl, writer = self._esl(api_response(b'+OK\n'))
+        headers, body = await esl.send('api status')
+
+        self.assertEqual(writer.data, b'api status\n\n')
+        self.assertEqual(headers['Content-Type'], 'api/response')
+        self.assertEqual(body, b'+OK\n')
+
+    async def test_send_many_keeps_order_and_drains_once(self):
+        esl, writer = self._esl(api_response(b'one') + api_response(b'two'))
+        results = await esl.send_many(['api first', 'api second'])
+
+        self.assertEqual(writer.data, b'api first\n\napi second\n\n')
+        self.assertEqual(writer.drained, 1)
+        self.assertEqual([body for _, body in results], [b'one', b'two'])
+
+    async def test_eof_in_headers(self):
+        esl, _ = self._esl(b'Content-Type: api/response\n')
+
+        with self.assertRaises(ESLHeaderError):
+            await esl.send('api status')
+
+    async def test_headers(self):
+        esl, _ = self._esl(b'Content-Type: auth/request\n\n'
+                           b'Content-Type: command/reply\nReply-Text: +OK accepted\n\n')
+        await esl.initialize()
+
+        self.assertTrue(await esl.login('ClueCon'))
+
+
+class FakeFreeswitch:
+
+    def __init__(self, answer_ping=True, max_greetings=None):
+        self.connections = 0
+        self.closed = 0
+        self._answer_ping = answer_ping
+        self._max_greetings = max_greetings
+
+    async def handle(self, reader, writer):
+        self.connections += 1
+        if self._max_greetings is None or self.connections <= self._max_greetings:
+            writer.write(b'Content-Type: auth/request\n\n')
+        try:
+            while True:
+                command = await reader.readuntil(b'\n\n')
+                if command.startswith(b'auth '):
+                    writer.write(b'Content-Type: command/reply\nReply-Text: +OK accepted\n\n')
+                elif self._answer_ping:
+                    writer.write(api_response(b'+OK\n'))
+                await writer.drain()
+        except asyncio.IncompleteReadError:
+            self.closed += 1
+        writer.close()
+
+
+class TestESLPool(IsolatedAsyncioTestCase):
+
+    async def _serve(self, freeswitch):
+        server = await asyncio.start_server(freeswitch.handle, '127.0.0.1', 0)
+        self.addAsyncCleanup(server.wait_closed)
+        self.addCleanup(server.close)
+        return server.sockets[0].getsockname()[1]
+
+    def _pool(self, port, **kwargs):
+        pool = ESLPool('127.0.0.1', port, 'ClueCon', **kwargs)
+        self.addAsyncCleanup(self._close, pool)
+        return pool
+
+    async def _close(self, pool):
+        pool.close()
+        # Let the fake server notice the closed connections.
+        await asyncio.sleep(0.05)
+
+    async def test_max_size_caps_open_connections(self):
+        freeswitch = FakeFreeswitch()
+        pool = self._pool(await self._serve(freeswitch), min_size=4, max_size=4)
+
+        async def scrape():
+            async with pool.acquire() as esl:
+                await esl.send('api status')
+
+        await asyncio.gather(*(scrape() for _ in range(4)))
+        await asyncio.gather(*(scrape() for _ in range(8)))
+
+        self.assertEqual(freeswitch.connections, 4)
+
+    async def test_min_size_is_clamped_to_max_size(self):
+        freeswitch = FakeFreeswitch()
+        pool = self._pool(await self._serve(freeswitch), min_size=8, max_size=2)
+
+        async with pool.acquire():
+            pass
+
+        self.assertEqual(freeswitch.connections, 2)
+
+    async def test_recently_released_connection_is_not_pinged(self):
+        freeswitch = FakeFreeswitch(answer_ping=False)
+        pool = self._pool(await self._serve(freeswitch))
+
+        async with pool.acquire():
+            pass
+        await asyncio.wait_for(self._borrow(pool), 0.1)
+
+        self.assertEqual(freeswitch.connections, 1)
+
+    async def test_connection_returned_after_close_is_closed(self):
+        freeswitch = FakeFreeswitch()
+        pool = self._pool(await self._serve(freeswitch))
+
+        async with pool.acquire():
+            pool.close()
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(freeswitch.closed, 1)
+        self.assertEqual(pool._size, 0)
+
+    async def test_cancelled_ping_closes_connection(self):
+        freeswitch = FakeFreeswitch(answer_ping=False)
+        pool = self._pool(await self._serve(freeswitch), ping_after=0)
+
+        async with pool.acquire():
+            pass
+
+        with mock.patch.object(ESL, 'close', autospec=True, side_effect=ESL.close) as close:
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(self._borrow(pool), 0.1)
+
+        close.assert_called_once()
+        await asyncio.sleep(0.05)
+        self.assertEqual(freeswitch.closed, 1)
+
+    async def test_cancelled_warm_up_closes_connection(self):
+        freeswitch = FakeFreeswitch(max_greetings=1)
+        pool = self._pool(await self._serve(freeswitch), min_size=2, max_size=2)
+
+        with self.assertRaises(asyncio.TimeoutError):
+            await asyncio.wait_for(self._borrow(pool), 0.1)
+
+        await asyncio.sleep(0.05)
+        self.assertEqual(freeswitch.connections, 2)
+        self.assertEqual(freeswitch.closed, 2)
+        self.assertEqual(pool._size, 0)
+
+    async def _borrow(self, pool):
+        async with pool.acquire():
+            pass
@@ -0,0 +1,99 @@
+from unittest import TestCase, mock
+from prometheus_client import CollectorRegistry, Counter, Summary
+from prometheus_client.core import GaugeMetricFamily
+from werkzeug.test import Client
+from freeswitch_exporter.collector import render_esl
+from freeswitch_exporter.http import FreeswitchExporterApplication
+
+
+CONFIG = {
+    'default': {
+        'password': 'ClueCon',
+    },
+    'edge': {
+        'port': 8022,
+        'password': 'secret',
+        'pool_max_size': 2,
+        'scrape_timeout': 3,
+        'scan_uuid_dump': True,
+        'cache_ttl': 60,
+    },
+    'idle': {
+        'cache_ttl': 0,
+        'pool_idle_timeout': 0,
+    },
+}
+
+
+class TestFreeswitchExporterApplication(TestCase):
+
+    def setUp(self):
+        self.registry = CollectorRegistry()
+        duration = Summary('freeswitch_collection_duration_seconds', '', ['module'],
+                           registry=self.registry)
+        self.errors = Counter('freeswitch_request_errors_total', '', ['module'],
+                              registry=self.registry)
+        self.loop = mock.Mock()
+        self.app = FreeswitchExporterApplication(CONFIG, duration, self.errors, self.loop)
+        self.client = Client(self.app)
+
+        metric = GaugeMetricFamily('freeswitch_up', 'FreeSWITCH is ready')
+        metric.add_metric([], 1)
+        patcher = mock.patch('freeswitch_exporter.http.collect_esl', return_value=[metric])
+        self.collect_esl = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _errors(self, module):
+        return self.registry.get_sample_value('freeswitch_request_errors_total',
+                                              {'module': module})
+
+    def test_module_and_target_select_pool(self):
+        response = self.client.get('/esl?module=edge&target=10.0.0.1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'freeswitch_up 1.0\n', response.data)
+
+        pool, loop, timeout, scan_variables = self.collect_esl.call_args.args
+        self.assertEqual((pool.host, pool.port, pool.max_size), ('10.0.0.1', 8022, 2))
+        self.assertEqual(pool._password, 'secret')
+        self.assertIs(loop, self.loop)
+        self.assertEqual((timeout, scan_variables), (3, True))
+
+    def test_unknown_module_is_not_found(self):
+        response = self.client.get('/esl?module=missing&target=10.0.0.1')
+
+        self.assertEqual(response.status_code, 404)
+        self.collect_esl.assert_not_called()
+        self.assertEqual(self._errors('missing'), None)
+
+    def test_unknown_path_is_not_found(self):
+        response = self.client.get('/missing')
+
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_scrape_is_reused(self):
+        with mock.patch('freeswitch_exporter.http.render_esl', wraps=render_esl) as render:
+            first = self.client.get('/esl?module=edge&target=10.0.0.1')
+            second = self.client.get('/esl?module=edge&target=10.0.0.1')
+
+        self.assertEqual(first.data, second.data)
+        self.collect_esl.assert_called_once()
+        render.assert_called_once()
+        self.assertEqual(self.registry.get_sample_value(
+            'freeswitch_collection_duration_seconds_count', {'module': 'edge'}), 1)
+
+    def test_expired_scrapes_are_pruned(self):
+        self.client.get('/esl?module=idle&target=10.0.0.1')
+        self.client.get('/esl?module=idle&target=10.0.0.2')
+
+        self.assertEqual(list(self.app._cache), [('idle', '10.0.0.2', 8021)])
+        self.assertEqual(list(self.app._cache_locks), [('idle', '10.0.0.2', 8021)])
+
+    def test_idle_pool_is_closed(self):
+        self.client.get('/esl?module=idle&target=10.0.0.1')
+        idle_pool = self.collect_esl.call_args.args[0]
+        self.client.get('/esl?module=idle&target=10.0.0.2')
+        self.client.get('/esl?module=idle&target=10.0.0.1')
+
+        self.loop.call_soon_threadsafe.assert_any_call(idle_pool.close)
+        self.assertIsNot(self.collect_esl.call_args.args[0], idle_pool)